@@ -0,0 +1,98 @@
+# 文件名: kernels.py
+# 策略用到的数值内核 (numba)。
+# 单独成模块：Streamlit 每次交互都会重新执行 app.py，
+# 放在这里的 JIT 函数只在进程内导入、编译/加载缓存一次。
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True, nogil=True)
+def rolling_mean(arr, window):
+    """
+    O(N) 滑动均值：每步减去移出窗口的旧值、加入新值 (Kahan 补偿求和)。
+    累加顺序与连续相同值的处理照搬 pandas rolling().mean()，
+    保证价格恰好等于均线时的信号判断与原实现一致；窗口未满或含 NaN 时输出 NaN
+    """
+    n = arr.shape[0]
+    out = np.full(n, np.nan)
+    total = 0.0
+    comp_add = 0.0
+    comp_rem = 0.0
+    nobs = 0
+    same_cnt = 0
+    prev = arr[0] if n > 0 else np.nan
+    for i in range(n):
+        if i >= window:
+            old = arr[i - window]
+            if old == old:
+                nobs -= 1
+                y = -old - comp_rem
+                t = total + y
+                comp_rem = t - total - y
+                total = t
+        v = arr[i]
+        if v == v:
+            nobs += 1
+            y = v - comp_add
+            t = total + y
+            comp_add = t - total - y
+            total = t
+            if v == prev:
+                same_cnt += 1
+            else:
+                same_cnt = 1
+            prev = v
+        if nobs >= window:
+            out[i] = prev if same_cnt >= nobs else total / nobs
+    return out
+
+
+@njit(cache=True, nogil=True)
+def escalator_signals(close, high, low, line_fast, line_slow):
+    """
+    扶梯策略内核：一次遍历得到通道上下沿 (kl_max/kl_min)、持仓状态 (Signal) 与买卖点 (Position)。
+    通道取快慢线逐点的 max/min (任一为 NaN 则为 NaN，同 np.maximum/np.minimum)；
+    前 1/2 根K线的位置 (kl_range_cur/pre) 在循环中滚动计算，不生成中间数组。
+    满足买入条件置 1，满足卖出条件置 0，否则沿用上一根的状态，
+    等价于 np.select + ffill().fillna(0) + diff()；NaN 参与比较恒为 False
+    """
+    n = close.shape[0]
+    kl_max = np.empty(n)
+    kl_min = np.empty(n)
+    signal = np.zeros(n, np.int8)
+    position = np.zeros(n, np.int8)
+    state = 0
+    range_pre = np.nan
+    range_cur = np.nan
+    for i in range(n):
+        fast = line_fast[i]
+        slow = line_slow[i]
+        if fast != fast or slow != slow:
+            kl_max[i] = np.nan
+            kl_min[i] = np.nan
+        elif fast >= slow:
+            kl_max[i] = fast
+            kl_min[i] = slow
+        else:
+            kl_max[i] = slow
+            kl_min[i] = fast
+
+        if close[i] > kl_max[i] and range_pre <= 0.25 and range_cur > 0.75:
+            state = 1
+        elif close[i] < kl_min[i] and range_pre >= 0.75 and range_cur < 0.25:
+            state = 0
+        signal[i] = state
+        if i > 0:
+            position[i] = state - signal[i - 1]
+
+        # 当前K线的位置供后两根使用，振幅为 0 时记为 NaN
+        denom = high[i] - low[i]
+        range_pre = range_cur
+        range_cur = (close[i] - low[i]) / denom if denom != 0 else np.nan
+    return kl_max, kl_min, signal, position
+
+
+# 导入时预热一次，避免第一次交互才付出编译 / 读取缓存的开销
+_dummy = np.zeros(16)
+rolling_mean(_dummy, 4)
+escalator_signals(_dummy, _dummy, _dummy, _dummy, _dummy)
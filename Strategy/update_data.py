@@ -1,8 +1,14 @@
 # 文件名: update_data.py (云端版)
 import akshare as ak
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+import io
 import os
-from datetime import datetime
+import sys
+import time
+from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- 配置 ---
 CODE_MAP = {
@@ -13,114 +19,351 @@ CODE_MAP = {
 
 DATA_DIR = "data"
 
-def update_data_akshare():
-    if not os.path.exists(DATA_DIR):
+# 列名映射表 (常量，模块加载时建一次)，兼容中文、英文、大小写
+RENAME_MAP = {
+    # 日期
+    '日期': 'Date', 'date': 'Date', 'Date': 'Date',
+    # 收盘
+    '收盘价': 'Close', '收盘': 'Close', 'close': 'Close', 'price': 'Close', 'last': 'Close',
+    # 最高
+    '最高价': 'High', '最高': 'High', 'high': 'High', 'max': 'High',
+    # 最低
+    '最低价': 'Low', '最低': 'Low', 'low': 'Low', 'min': 'Low',
+    # 开盘
+    '开盘价': 'Open', '开盘': 'Open', 'open': 'Open',
+    # 量
+    '成交量': 'Volume', 'vol': 'Volume', 'volume': 'Volume'
+}
+
+# 本地缓存有效期 (秒)：当天已更新且未超过有效期的品种跳过下载，设为 0 关闭
+CACHE_TTL_SEC = int(os.environ.get("ZC_CACHE_TTL_SEC", 86400))
+
+# 写文件用 1MB 缓冲：写出器的零碎小块在内存里攒满后再一次性落盘，减少 write 系统调用
+WRITE_BUFFER = 1024 * 1024
+
+def _is_fresh(file_path):
+    """CSV 是否为今天写出 (或今天核对过没有新数据)、且未超过缓存有效期"""
+    if CACHE_TTL_SEC <= 0 or not os.path.exists(file_path):
+        return False
+    mtime = os.path.getmtime(file_path)
+    today = datetime.now().date()
+    return datetime.fromtimestamp(mtime).date() == today and time.time() - mtime < CACHE_TTL_SEC
+
+# --- 共享 HTTP 连接 ---
+# akshare 各接口模块直接调用 requests.get / requests.post，每次都新建 TCP+TLS 连接。
+# 把用到的模块里的 requests 换成走共享 Session 的代理，同一主机 (AU/AG 都走新浪) 复用 keep-alive 连接。
+_AK_MODULES = (
+    'akshare.futures_derivative.futures_index_sina',  # futures_main_sina
+    'akshare.spot.spot_sge',                           # spot_hist_sge
+)
+
+# 单次请求超时 (秒, 连接/读取)：akshare 自己不传 timeout，不设的话卡住的连接会一直挂着，走不到下面的重试
+HTTP_TIMEOUT = (10, 30)
+
+class _SessionRequests:
+    """替代模块里的 requests：get/post 走共享 Session，其余属性照旧取 requests 模块"""
+    def __init__(self, session):
+        self._session = session
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', HTTP_TIMEOUT)
+        return self._session.get(url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        kwargs.setdefault('timeout', HTTP_TIMEOUT)
+        return self._session.post(url, data=data, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+def _share_session():
+    """给 akshare 接口模块装上共享 Session；akshare 版本变动找不到对应模块时保持原样"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=len(CODE_MAP))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    shim = _SessionRequests(session)
+    for name in _AK_MODULES:
+        module = sys.modules.get(name)
+        if module is not None and getattr(module, 'requests', None) is requests:
+            module.requests = shim
+
+# 网络类错误 (超时 / 连接失败) 的最多尝试次数，间隔按 1s、2s、4s... 指数退避 (最长 10s)
+MAX_ATTEMPTS = 3
+
+def _call_with_retry(func, *args, **kwargs):
+    """调用 akshare 接口，仅对网络类错误重试；其它异常 (如接口返回格式变了) 直接抛出"""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return func(*args, **kwargs)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            wait = min(2 ** (attempt - 1), 10)
+            print(f"⚠️ {func.__name__} 网络异常 ({type(e).__name__})，{wait}s 后第 {attempt + 1} 次尝试...")
+            time.sleep(wait)
+
+def _stored_tail(file_path):
+    """已有 CSV 的 (列名列表, 最后一个日期, 最后一行的字节, 最后一行的起始偏移)；
+    文件不存在、没有数据行或读取失败时全部返回 None"""
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.readline()
+            size = f.seek(0, os.SEEK_END)
+            # 只读文件尾部找最后一行，一根K线远小于 4KB
+            start = max(size - 4096, len(header))
+            f.seek(start)
+            tail = f.read()
+        cut = tail.rfind(b'\n', 0, len(tail.rstrip(b'\r\n')))
+        last_line = tail[cut + 1:]
+        if not last_line.strip() or (cut < 0 and start > len(header)):
+            return None, None, None, None
+        columns = header.decode().rstrip('\r\n').split(',')
+        last_date = pd.Timestamp(last_line.split(b',', 1)[0].decode())
+        return columns, last_date, last_line, start + cut + 1
+    except Exception:
+        return None, None, None, None
+
+def _float_text(x):
+    """浮点数的最短往返写法，整数值去掉 '.0' (6190.0 -> 6190)，缺失值写空，和 pyarrow 写出器一致"""
+    if x != x:
+        return ''
+    s = repr(float(x))
+    return s[:-2] if s.endswith('.0') else s
+
+def _csv_to(df, f, header=True):
+    """把 df 按 CSV 写进二进制句柄 f (Date 写成 YYYY-MM-DD)：优先用 pyarrow 的 C++ 写出器，未安装 pyarrow 时退回 pandas"""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        # pandas 默认把整数值的 float 写成 6190.0，先按 pyarrow 的写法转成文本，两条路径写出的内容一致
+        float_cols = df.select_dtypes('float').columns
+        if len(float_cols):
+            df = df.assign(**{c: df[c].map(_float_text) for c in float_cols})
+        df.to_csv(f, header=header, index=False, date_format='%Y-%m-%d', lineterminator='\n')
+        return
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.set_column(0, 'Date', table.column('Date').cast(pa.date32()))
+    if header:
+        # 表头自己写，保持和 pandas 一样不加引号
+        f.write((','.join(table.column_names) + '\n').encode())
+    pacsv.write_csv(table, f, pacsv.WriteOptions(include_header=False))
+
+def _write_csv(df, file_path, append=False, replace_from=None):
+    """写出 CSV，经 WRITE_BUFFER 缓冲落盘：默认整表重写；append=True 时把数据行追加到末尾，
+    再给出 replace_from 时先截掉该字节偏移之后的内容 (即替换文件最后一行) 再追加"""
+    mode = 'wb' if not append else ('ab' if replace_from is None else 'r+b')
+    with open(file_path, mode, buffering=WRITE_BUFFER) as f:
+        if replace_from is not None:
+            f.seek(replace_from)
+            f.truncate()
+        _csv_to(df, f, header=not append)
+
+def _parse_dates(s):
+    """日期列转 datetime64：akshare 返回的 datetime.date 对象直接走 numpy 日期转换，
+    字符串按固定的 YYYY-MM-DD 格式解析，都不符合时再交给 pandas 自动推断格式"""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    if type(s.iloc[0]) is date:
+        try:
+            return pd.Series(s.to_numpy(dtype='datetime64[D]'), index=s.index, name=s.name)
+        except (ValueError, TypeError):
+            pass
+    try:
+        return pd.to_datetime(s, format='%Y-%m-%d')
+    except (ValueError, TypeError):
+        return pd.to_datetime(s)
+
+def _fetch_one(wind_code, ak_code):
+    """获取并清洗单个品种的数据，返回按日期排序的 DataFrame (Date 为普通列)；为空或出错时返回 None"""
+    print(f"\n📡 正在获取 {wind_code} (AkShare代码: {ak_code})...")
+    
+    try:
+        df = pd.DataFrame()
+
+        # ---------------------------
+        # 1. 期货数据 (新浪财经接口)
+        # ---------------------------
+        if wind_code in ['AU.SHF', 'AG.SHF']:
+            df = _call_with_retry(ak.futures_main_sina, symbol=ak_code)
+            # 典型返回列: 日期, 开盘价, 最高价, 最低价, 收盘价, 成交量, 持仓量
+
+        # ---------------------------
+        # 2. 现货数据 (上海黄金交易所接口)
+        # ---------------------------
+        elif wind_code == 'Au9999.SGE':
+            # 注意：spot_hist_sge 接口有时不稳定，如果报错，需检查 akshare 版本
+            df = _call_with_retry(ak.spot_hist_sge, symbol=ak_code)
+
+        if df.empty:
+            print(f"⚠️ {wind_code} 获取到的数据为空，跳过。")
+            return None
+
+        # ---------------------------
+        # 3. 统一列名清洗 (核心步骤)
+        # ---------------------------
+        # 直接按模块级 RENAME_MAP 改名，只涉及几个列名，列表推导即可
+        df.columns = [RENAME_MAP.get(c, c) for c in df.columns]
+
+        # ---------------------------
+        # 4. 确保必要列存在
+        # ---------------------------
+        required_cols = ['Date', 'Close', 'High', 'Low']
+
+        # 检查缺失列 (列名集合只建一次，后面的判断都查这个集合)
+        present = set(df.columns)
+        missing_cols = [c for c in required_cols if c not in present]
+
+        if 'Date' in missing_cols:
+            print("❌ 严重错误：找不到日期列，无法处理。")
+            return None
+
+        # 如果缺少 High/Low (比如某些现货源只有收盘价)，用 Close 填充，防止策略报错
+        if 'High' not in present:
+            print("⚠️ 警告：缺失 'High' 列，使用 'Close' 填充")
+            df['High'] = df['Close']
+        if 'Low' not in present:
+            print("⚠️ 警告：缺失 'Low' 列，使用 'Close' 填充")
+            df['Low'] = df['Close']
+        present.update(('High', 'Low'))
+
+        # 需要保留的列
+        cols_to_keep = [c for c in ['Date', 'Open', 'High', 'Low', 'Close', 'Volume'] if c in present]
+
+        # ---------------------------
+        # 5. 格式转换与保存
+        # ---------------------------
+        # 先在接口返回的 df 上原地转换，最后再取列子集 + 排序，省掉一次整表 .copy()
+        # 处理时间 (Date 保持为普通列，写出时不走索引格式化)
+        df['Date'] = _parse_dates(df['Date'])
+
+        # 处理数值 (防止千分位字符串 '1,234.00' 导致报错)
+        # 已是数值类型的列不用动，其余 (字符串) 列一次性去掉逗号、转成数字
+        text_cols = [c for c in cols_to_keep[1:] if not pd.api.types.is_numeric_dtype(df[c])]
+        if text_cols:
+            df[text_cols] = df[text_cols].replace(',', '', regex=True).apply(pd.to_numeric, errors='coerce')
+
+        df = df[cols_to_keep].sort_values('Date')
+
+        return df
+
+    except Exception as e:
+        print(f"❌ 处理 {wind_code} 时发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def _archive_parquet(df, wind_code):
+    """把本次取到的完整历史存为 data/archive/{代码}_{YYYYMMDD}.parquet；
+    归档只是附带的快照，任何失败 (目录冲突、缺 pyarrow 等) 只打印警告，不影响实时文件"""
+    try:
+        archive_dir = os.path.join(DATA_DIR, "archive")
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_path = os.path.join(archive_dir, f"{wind_code}_{datetime.now():%Y%m%d}.parquet")
+        df.to_parquet(archive_path, engine='pyarrow', compression='zstd', compression_level=3, index=False)
+        print(f"🗄️ 已归档: {archive_path}")
+    except Exception as e:
+        print(f"⚠️ {wind_code} 归档失败 (实时数据不受影响): {e}")
+
+def update_data_akshare(force=False, fmt="csv", archive=False):
+    """fmt: "csv" (默认，app 读取的格式) 或 "feather" (二进制列存，写入更快、文件更小)；
+    archive=True 时另把本次取到的完整历史存一份 data/archive/{代码}_{YYYYMMDD}.parquet (zstd 压缩) 快照"""
+    if fmt not in ("csv", "feather"):
+        raise ValueError(f"不支持的存储格式: {fmt}")
+
+    # 直接 mkdir，目录已存在时 (绝大多数情况) 由 FileExistsError 告知，省掉一次 stat
+    try:
         os.makedirs(DATA_DIR)
         print(f"📁 创建数据目录: {DATA_DIR}")
+    except FileExistsError:
+        pass
 
     print("🚀 开始从 AkShare 获取数据...")
+    _share_session()
 
+    # 今天已经更新过的品种不再重复下载 (force=True 时全部重新获取)
+    todo = {}
     for wind_code, ak_code in CODE_MAP.items():
-        print(f"\n📡 正在获取 {wind_code} (AkShare代码: {ak_code})...")
-        
-        try:
-            df = pd.DataFrame()
-            
-            # ---------------------------
-            # 1. 期货数据 (新浪财经接口)
-            # ---------------------------
-            if wind_code in ['AU.SHF', 'AG.SHF']:
-                df = ak.futures_main_sina(symbol=ak_code)
-                # 典型返回列: 日期, 开盘价, 最高价, 最低价, 收盘价, 成交量, 持仓量
-
-            # ---------------------------
-            # 2. 现货数据 (上海黄金交易所接口)
-            # ---------------------------
-            elif wind_code == 'Au9999.SGE':
-                # 注意：spot_hist_sge 接口有时不稳定，如果报错，需检查 akshare 版本
-                df = ak.spot_hist_sge(symbol=ak_code)
-            
-            if df.empty:
-                print(f"⚠️ {wind_code} 获取到的数据为空，跳过。")
-                continue
+        if not force and _is_fresh(os.path.join(DATA_DIR, f"{wind_code}.{fmt}")):
+            print(f"⏭️ {wind_code} 今日数据已是最新，跳过。")
+        else:
+            todo[wind_code] = ak_code
+
+    if not todo:
+        print("\n🎉 所有任务完成！")
+        return
 
-            # ---------------------------
-            # 3. 统一列名清洗 (核心步骤)
-            # ---------------------------
-            # 建立一个超级映射表，兼容中文、英文、大小写
-            rename_map = {
-                # 日期
-                '日期': 'Date', 'date': 'Date', 'Date': 'Date',
-                # 收盘
-                '收盘价': 'Close', '收盘': 'Close', 'close': 'Close', 'price': 'Close', 'last': 'Close',
-                # 最高
-                '最高价': 'High', '最高': 'High', 'high': 'High', 'max': 'High',
-                # 最低
-                '最低价': 'Low', '最低': 'Low', 'low': 'Low', 'min': 'Low',
-                # 开盘
-                '开盘价': 'Open', '开盘': 'Open', 'open': 'Open',
-                # 量
-                '成交量': 'Volume', 'vol': 'Volume', 'volume': 'Volume'
-            }
-            
-            # 先把列名去空格并转小写(辅助匹配)，但为了映射表生效，我们直接重命名匹配到的
-            df.rename(columns=rename_map, inplace=True)
-
-            # ---------------------------
-            # 4. 确保必要列存在
-            # ---------------------------
-            required_cols = ['Date', 'Close', 'High', 'Low']
-            
-            # 检查缺失列
-            missing_cols = [c for c in required_cols if c not in df.columns]
-            
-            if 'Date' in missing_cols:
-                print("❌ 严重错误：找不到日期列，无法处理。")
+    # 各品种的请求互不依赖：线程池并发获取 (等待网络时释放 GIL)，谁先完成先保存
+    with ThreadPoolExecutor(max_workers=len(todo)) as executor:
+        futures = {executor.submit(_fetch_one, w, a): w for w, a in todo.items()}
+        for future in as_completed(futures):
+            wind_code = futures[future]
+            df = future.result()
+            if df is None:
                 continue
-                
-            # 如果缺少 High/Low (比如某些现货源只有收盘价)，用 Close 填充，防止策略报错
-            if 'High' not in df.columns:
-                print("⚠️ 警告：缺失 'High' 列，使用 'Close' 填充")
-                df['High'] = df['Close']
-            if 'Low' not in df.columns:
-                print("⚠️ 警告：缺失 'Low' 列，使用 'Close' 填充")
-                df['Low'] = df['Close']
-
-            # 只保留需要的列
-            cols_to_keep = [c for c in ['Date', 'Open', 'High', 'Low', 'Close', 'Volume'] if c in df.columns]
-            df = df[cols_to_keep].copy()
-
-            # ---------------------------
-            # 5. 格式转换与保存
-            # ---------------------------
-            # 处理时间
-            df['Date'] = pd.to_datetime(df['Date'])
-            df.set_index('Date', inplace=True)
-            df.sort_index(inplace=True)
-
-            # 处理数值 (防止千分位字符串 '1,234.00' 导致报错)
-            for col in df.columns:
-                # 尝试转为字符串，去掉逗号，再转数字
-                if df[col].dtype == 'object':
-                     df[col] = df[col].astype(str).str.replace(',', '')
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-
-            # 保存 CSV
-            file_path = os.path.join(DATA_DIR, f"{wind_code}.csv")
-            df.to_csv(file_path)
-            
-            print(f"✅ 成功保存: {file_path}")
-            print(f"   📊 数据范围: {df.index[0].strftime('%Y-%m-%d')} -> {df.index[-1].strftime('%Y-%m-%d')}")
-            print(f"   📝 包含列名: {list(df.columns)}")
-
-        except Exception as e:
-            print(f"❌ 处理 {wind_code} 时发生异常: {e}")
-            import traceback
-            traceback.print_exc()
+
+            try:
+                file_path = os.path.join(DATA_DIR, f"{wind_code}.{fmt}")
+
+                if fmt == "feather":
+                    # Feather 没有追加模式，整表重写 (lz4 压缩)
+                    df.reset_index(drop=True).to_feather(file_path, compression='lz4')
+                    print(f"✅ 成功保存: {file_path}")
+                    print(f"   📊 数据范围: {df['Date'].iloc[0].strftime('%Y-%m-%d')} -> {df['Date'].iloc[-1].strftime('%Y-%m-%d')}")
+                    continue
+
+                # 保存 CSV (日期固定写成 YYYY-MM-DD，app 端 pyarrow 读取时直接按 ISO 日期解析)
+                # 增量：列结构不变时只把最后一个已存日期之后的新K线追加到文件末尾，
+                # 不重写整个历史 (金交所接口没有起始日期参数；新浪接口的 start_date 也是取回全量后
+                # 在本地截取，省不了下载量，所以都是取回后再过滤)
+                stored_cols, last_date, last_line, last_pos = _stored_tail(file_path)
+                tail = df[df['Date'] >= last_date] if stored_cols == list(df.columns) else None
+                if tail is not None and not tail.empty and tail['Date'].iloc[0] == last_date:
+                    # 已存的最后一根K线也重新核对：盘中跑出来的未收盘K线之后会变，
+                    # 和文件最后一行逐字节比较，不一致时连同这一行一起重写
+                    buf = io.BytesIO()
+                    _csv_to(tail.iloc[:1], buf, header=False)
+                    last_changed = buf.getvalue() != last_line
+                    new_rows = tail if last_changed else tail.iloc[1:]
+                    if new_rows.empty:
+                        # 内容不动，只刷新 mtime 记下"今天已核对过"，当天再运行时 _is_fresh 照样跳过下载
+                        os.utime(file_path)
+                        print(f"⏭️ {wind_code} 没有新数据 (最新: {last_date.strftime('%Y-%m-%d')})")
+                        continue
+                    _write_csv(new_rows, file_path, append=True, replace_from=last_pos if last_changed else None)
+                    if last_changed:
+                        print(f"✅ 更新 {last_date.strftime('%Y-%m-%d')} 的K线并追加 {len(new_rows) - 1} 条新数据: {file_path}")
+                    else:
+                        print(f"✅ 追加 {len(new_rows)} 条新数据: {file_path}")
+                else:
+                    _write_csv(df, file_path)
+                    print(f"✅ 成功保存: {file_path}")
+
+                print(f"   📊 数据范围: {df['Date'].iloc[0].strftime('%Y-%m-%d')} -> {df['Date'].iloc[-1].strftime('%Y-%m-%d')}")
+                print(f"   📝 包含列名: {list(df.columns.drop('Date'))}")
+
+            except Exception as e:
+                print(f"❌ 保存 {wind_code} 时发生异常: {e}")
+                import traceback
+                traceback.print_exc()
+
+            finally:
+                # 先写实时文件，再归档 (上面各分支提前 continue 时 finally 也会执行)
+                if archive:
+                    _archive_parquet(df, wind_code)
 
     print("\n🎉 所有任务完成！")
 
 if __name__ == "__main__":
     # 确保安装了 akshare: pip install akshare --upgrade
-    update_data_akshare()
+    # python update_data.py --force    忽略本地缓存，全部重新下载
+    # python update_data.py --feather  另存为 Feather 格式 (app 目前只读取 CSV)
+    # python update_data.py --archive  额外保存一份当日 Parquet 归档快照
+    update_data_akshare(
+        force="--force" in sys.argv,
+        fmt="feather" if "--feather" in sys.argv else "csv",
+        archive="--archive" in sys.argv,
+    )
 